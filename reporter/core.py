@@ -5,17 +5,34 @@ Refer to:
     - sys.excepthook        :    https://docs.python.org/3/library/sys.html#sys.excepthook
     - threading.excepthook :    https://docs.python.org/3/library/threading.html#threading.excepthook
 """
+import atexit
+import contextlib
 import datetime
 import functools
+import hashlib
+import json
 import logging
+import os
+import queue
+import re
 import sys
 import threading
+import time
 import traceback
-from typing import Any, Optional, Type
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple, Type
 
-from gitlab import Gitlab
+from gitlab import Gitlab, GitlabError, GitlabHttpError
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from gitlab.v4.objects import ProjectIssue, Project
 
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
 if sys.version_info <= (3, 8, 0):
     PY_37 = True
 else:
@@ -28,24 +45,140 @@ if not PY_37:
 
 logger = logging.getLogger('python-gitlab-reporter')
 
+# Maximum number of recently reported titles that are remembered for the cooldown
+RECENT_CACHE_SIZE = 256
+
+# Maximum number of reports waiting to be sent to GitLab. Further reports are dropped.
+QUEUE_SIZE = 128
+
+# The worker collects up to BATCH_SIZE reports for up to BATCH_WAIT seconds,
+# so that a burst of identical errors results in a single request
+BATCH_SIZE = 64
+BATCH_WAIT = 0.2
+
+# Seconds to wait for pending reports when the interpreter exits
+FLUSH_TIMEOUT = 5.0
+
+# The REST issue search gives up after this many candidates
+MAX_CANDIDATES = 500
+
+# Known issue iids are persisted in this directory, so that they survive restarts
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "python-gitlab-reporter"
+)
+
+# Persisted iids are discarded after this many seconds
+IID_CACHE_TTL = 7 * 24 * 60 * 60
+
+# Only the last TB_LIMIT frames of a traceback are reported
+TB_LIMIT = 50
+
+# Formatted tracebacks are clipped to this many characters to stay below GitLab's description size limit
+MAX_TRACEBACK_SIZE = 60 * 1024
+
+# Gitlab rejects issue titles longer than this many characters
+MAX_TITLE_SIZE = 255
+
+# The exception summary in the header of a description is clipped to this many characters
+MAX_SUMMARY_SIZE = 1024
+
+# GraphQL query for the iids and titles of issues whose title matches a search term, one page at a time
+_ISSUE_QUERY = """
+query($path: ID!, $search: String!, $after: String) {
+  project(fullPath: $path) {
+    issues(search: $search, in: [TITLE], first: 100, after: $after) {
+      nodes { iid title }
+      pageInfo { hasNextPage endCursor }
+    }
+  }
+}
+"""
+
+# Codes and messages of GraphQL errors that mean the issue query is not supported by the Gitlab version
+_SCHEMA_ERROR_CODES = frozenset(("undefinedField", "argumentNotAccepted", "argumentLiteralsIncompatible"))
+_SCHEMA_ERROR = re.compile(r"doesn't (accept argument|exist on type)|has an invalid value")
+
+# Invariant parts of an issue description
+_HEADER_FMT = "# Uncaught exception '{}'"
+_FENCE_OPEN = "\n\n```py\n"
+_FENCE_CLOSE = "```\n"
+_TIMESTAMP_FMT = "The error lastly occurred at: **{}**\n"
+_TRUNCATED = "... (truncated)\n"
+_ELLIPSIS = "..."
+_TRAILER = "\n\n\n(*This issue was automatically opened by python-gitlab-reporter*)"
+
+
+def _format_traceback(exc: traceback.TracebackException) -> str:
+    """
+    Format a traceback, clipped to MAX_TRACEBACK_SIZE characters.
+    The end is kept, because the innermost frames and the exception itself are the most useful part.
+
+    :param exc:                 The exception to format.
+
+    :return: Multiline string.
+    """
+    lines: "Deque[str]" = deque()
+    size = 0
+    truncated = False
+    for line in exc.format():
+        if len(line) > MAX_SUMMARY_SIZE:
+            line = _clip(line, MAX_SUMMARY_SIZE) + "\n"
+        lines.append(line)
+        size += len(line)
+        while size > MAX_TRACEBACK_SIZE:
+            size -= len(lines.popleft())
+            truncated = True
+    return (_TRUNCATED if truncated else "") + "".join(lines)
+
+
+def _clip(text: str, size: int) -> str:
+    """
+    Clip a string to at most `size` characters, marking the cut with an ellipsis.
+
+    :param text:                The string to clip.
+    :param size:                Maximum number of characters.
+
+    :return: The (possibly) clipped string.
+    """
+    if len(text) <= size:
+        return text
+    return text[:size - len(_ELLIPSIS)] + _ELLIPSIS
+
+
+def _render_description(summary: str, trace: str, now_iso: Optional[str] = None) -> str:
+    """
+    Assemble a description from an already formatted exception summary and traceback.
+
+    :param summary:             Exception summary, e.g. "ValueError: Ooopsie".
+    :param trace:               Formatted traceback.
+    :param now_iso:             Timestamp of the error. Defaults to now.
+
+    :return: Multiline string.
+    """
+    if now_iso is None:
+        now_iso = datetime.datetime.now().isoformat(timespec="seconds")
+    return (
+        f"{_HEADER_FMT.format(_clip(summary, MAX_SUMMARY_SIZE))}{_FENCE_OPEN}{trace}{_FENCE_CLOSE}"
+        f"{_TIMESTAMP_FMT.format(now_iso)}{_TRAILER}"
+    )
+
 
-def _description(exc_type: Type[BaseException], exc_value: Any, exc_traceback: Any) -> str:
+def _description(exc_type: Type[BaseException], exc_value: Any, exc_traceback: Any, limit: int = TB_LIMIT,
+                 now_iso: Optional[str] = None) -> str:
     """
     Transform a set of exception attributes into a human readable description.
 
     :param exc_type:            Exception type.
     :param exc_value:           Exception value.
     :param exc_traceback:       Exception traceback.
+    :param limit:               Maximum number of (most recent) frames to include.
+    :param now_iso:             Timestamp of the error. Defaults to now.
 
     :return: Multiline string.
     """
-    description = f"# Uncaught exception '{exc_type.__name__}: {str(exc_value)}'\n\n"
-    description += "```py\n"
-    description += "".join(traceback.format_exception(exc_type, exc_value, exc_traceback))
-    description += "```\n"
-    description += f"The error lastly occurred at: **{datetime.datetime.now().isoformat()}**\n"
-    description += "\n\n\n(*This issue was automatically opened by python-gitlab-reporter*)"
-    return description
+    exc = traceback.TracebackException(exc_type, exc_value, exc_traceback, limit=-limit, capture_locals=False)
+    return _render_description(f"{exc_type.__name__}: {exc_value}", _format_traceback(exc), now_iso=now_iso)
 
 
 def _title(exc_type: Type[BaseException], exc_value: Any, exc_traceback: Any) -> str:
@@ -56,9 +189,17 @@ def _title(exc_type: Type[BaseException], exc_value: Any, exc_traceback: Any) ->
     :param exc_value:           Exception value.
     :param exc_traceback:       Exception traceback.
 
-    :return: a single line string.
+    :return: a single line string of at most MAX_TITLE_SIZE characters.
     """
-    return f"{exc_type.__name__}: {str(exc_value)}"
+    prefix = f"{exc_type.__name__}: "
+
+    # The location where the exception was raised tells apart equal exceptions raised by different code
+    frames = traceback.extract_tb(exc_traceback, limit=-1)
+    suffix = f" @ {os.path.basename(frames[-1].filename)}:{frames[-1].lineno}" if frames else ""
+
+    # Long messages are shortened, so that the location is kept
+    message = _clip(str(exc_value), max(MAX_TITLE_SIZE - len(prefix) - len(suffix), len(_ELLIPSIS)))
+    return _clip(f"{prefix}{message}{suffix}", MAX_TITLE_SIZE)
 
 
 def _create_issue(project: Project, title: str, description: str, assignee_id: Optional[int] = None) -> ProjectIssue:
@@ -95,9 +236,306 @@ def _reopen_issue(issue: ProjectIssue, description: str) -> None:
     issue.save()
 
 
+def _find_issue(project: Project, title: str) -> Optional[ProjectIssue]:
+    """
+    Look up an existing issue by its exact title.
+
+    The search is done server side, so that only a handful of candidates are transferred instead of every issue
+    of the project. GitLab matches the search term as a substring, so the title is still compared exactly.
+
+    :param project:         gitlab.Project instance to search in
+    :param title:           exact title of the issue (str)
+    :return:                The matching issue or None
+    """
+    # `in` is a Python keyword, hence the filters are passed as query_parameters.
+    # Recently updated issues come first, as recurring errors are likely among them.
+    candidates = project.issues.list(
+        query_parameters={"search": title, "in": "title", "state": "all", "order_by": "updated_at", "sort": "desc"},
+        per_page=100,
+        iterator=True,
+    )
+    for i, issue in enumerate(candidates):
+        if i >= MAX_CANDIDATES:
+            break
+        if issue.title == title:
+            return issue
+    return None
+
+
+class _GraphQLUnsupported(GitlabError):
+    """
+    The Gitlab instance does not offer the GraphQL API or rejected the issue query.
+    """
+
+
+def _is_schema_error(error: Any) -> bool:
+    """
+    Check whether a GraphQL error says that the query does not fit the schema of this Gitlab version.
+
+    :param error:           An entry of the "errors" list of a GraphQL response
+    :return:                True for unknown fields or arguments, False for every other error
+    """
+    if not isinstance(error, dict):
+        return False
+    code = (error.get("extensions") or {}).get("code")
+    return code in _SCHEMA_ERROR_CODES or bool(_SCHEMA_ERROR.search(str(error.get("message", ""))))
+
+
+def _find_issue_gql(gitlab: Gitlab, project: Project, title: str) -> Optional[ProjectIssue]:
+    """
+    Look up an existing issue by its exact title using the GraphQL API.
+
+    Only the iid and title of the candidates are transferred, instead of complete issues.
+    Like the REST search, at most MAX_CANDIDATES candidates are checked.
+
+    :param gitlab:          gitlab.Gitlab instance to send the query with
+    :param project:         gitlab.Project instance to search in
+    :param title:           exact title of the issue (str)
+    :return:                The matching issue (lazy, only its iid is known) or None
+    :raises _GraphQLUnsupported: If the Gitlab instance has no GraphQL API or its schema does not fit the query
+    :raises GitlabError:    If the query failed otherwise, e.g. because Gitlab is temporarily unavailable
+    """
+    variables = {"path": project.path_with_namespace, "search": title, "after": None}
+    checked = 0
+    while checked < MAX_CANDIDATES:
+        try:
+            result = gitlab.http_post(
+                f"{gitlab.url}/api/graphql", post_data={"query": _ISSUE_QUERY, "variables": variables}
+            )
+        except GitlabHttpError as err:
+            if err.response_code == 404:
+                raise _GraphQLUnsupported(f"GraphQL API not available: {err}") from err
+            raise
+
+        if not isinstance(result, dict):
+            raise GitlabError(f"Unexpected GraphQL response: {result!r}")
+        errors = result.get("errors")
+        if errors and all(_is_schema_error(error) for error in errors):
+            raise _GraphQLUnsupported(f"GraphQL issue search not supported: {errors}")
+        if errors:
+            raise GitlabError(f"GraphQL issue search failed: {errors}")
+        if not (result.get("data") or {}).get("project"):
+            raise GitlabError(f"Project {project.path_with_namespace} not found via GraphQL")
+
+        issues = result["data"]["project"]["issues"]
+        for node in issues["nodes"]:
+            if node["title"] == title:
+                return project.issues.get(int(node["iid"]), lazy=True)
+        checked += len(issues["nodes"])
+
+        if not issues["pageInfo"]["hasNextPage"]:
+            break
+        variables["after"] = issues["pageInfo"]["endCursor"]
+    return None
+
+
+@contextlib.contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    """
+    Hold an exclusive lock on `path`.lock, so that multiple processes do not corrupt each others writes.
+
+    :param path:            path of the file to protect
+    """
+    with open(f"{path}.lock", "a") as fh:
+        if sys.platform == "win32":
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _load_iids(path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Load persisted issue iids. Missing or broken files are treated as empty and expired entries are discarded.
+
+    :param path:            path of the JSON file
+    :return:                A mapping of issue titles to {"iid": ..., "reported_at": ...}
+    """
+    try:
+        with open(path) as fh:
+            iids = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+    if not isinstance(iids, dict):
+        return {}
+
+    now = time.time()
+    return {
+        title: entry for title, entry in iids.items()
+        if _valid_iid_entry(entry) and now - entry["reported_at"] < IID_CACHE_TTL
+    }
+
+
+def _valid_iid_entry(entry: Any) -> bool:
+    """
+    Check whether a persisted entry has an integer iid and a numeric timestamp.
+
+    :param entry:           an entry loaded from the JSON file
+    :return:                True if the entry can be used
+    """
+    if not isinstance(entry, dict):
+        return False
+    iid, reported_at = entry.get("iid"), entry.get("reported_at")
+    return (
+        isinstance(iid, int) and not isinstance(iid, bool)
+        and isinstance(reported_at, (int, float)) and not isinstance(reported_at, bool)
+    )
+
+
+def _iids_path(cache_dir: str, host: str, project_id: int) -> str:
+    """
+    Get the path of the file that persists the iids of a project.
+    Project ids are only unique per Gitlab instance, hence the host is part of the file name.
+
+    :param cache_dir:       directory to persist known issues in
+    :param host:            URL of the Gitlab instance
+    :param project_id:      the ID of the project
+    :return:                path of the JSON file
+    """
+    host_hash = hashlib.sha1(host.encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, f"{host_hash}-{project_id}.json")
+
+
+def _store_iid(path: str, title: str, iid: int) -> None:
+    """
+    Persist the iid of an issue. The file is replaced atomically, entries of other processes are preserved.
+
+    :param path:            path of the JSON file
+    :param title:           title of the issue (str)
+    :param iid:             iid of the issue (int)
+    :return:                None
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _file_lock(path):
+        iids = _load_iids(path)
+        iids[title] = {"iid": iid, "reported_at": time.time()}
+
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(iids, fh)
+        os.replace(tmp, path)
+
+
+def _mount_adapter(session: Session) -> None:
+    """
+    Keep connections to Gitlab alive and retry transient errors of idempotent requests.
+    Once the retries are used up, the last response is handed to python-gitlab, which raises a GitlabError.
+
+    :param session:             The session used by the Gitlab client.
+
+    :return: None
+    """
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(
+            total=3, backoff_factor=0.2, status_forcelist=(429, 502, 503, 504), raise_on_status=False
+        )
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def _log_failure(err: Exception) -> None:
+    """
+    Log an error of the reporter itself. The traceback is only formatted if DEBUG logging is enabled.
+
+    :param err:             the error to log
+    :return:                None
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.exception(err)
+    else:
+        logger.error("python-gitlab-reporter failed: %r", err)
+
+
+def _make_enqueue(pending: "queue.Queue[Tuple[str, str, traceback.TracebackException]]",
+                  recent: "OrderedDict[str, float]", recent_lock: threading.Lock, cooldown_seconds: float,
+                  tb_limit: int) -> Callable[[Type[BaseException], BaseException, Any], None]:
+    """
+    Build the function that queues an exception for the background worker.
+    The queue, the cooldown state and the settings are bound when it is built, so that the excepthooks do not
+    look up anything on the Reporter class.
+
+    :param pending:             queue that is drained by the worker
+    :param recent:              recently reported titles and when they were reported (time.monotonic)
+    :param recent_lock:         lock guarding `recent`
+    :param cooldown_seconds:    the same error is queued at most once within this period
+    :param tb_limit:            maximum number of (most recent) frames to report
+    :return:                    the new function
+    """
+
+    def enqueue(exc_type: Type[BaseException], exc_value: BaseException, exc_traceback: Any) -> None:
+        try:
+            # Was the same error reported just now? Then there is nothing new to tell GitLab.
+            title = _title(exc_type, exc_value, exc_traceback)
+            with recent_lock:
+                reported_at = recent.get(title)
+            if reported_at is not None and time.monotonic() - reported_at < cooldown_seconds:
+                logger.debug("'%s' was reported less than %s seconds ago. Skipping.", title, cooldown_seconds)
+                return
+
+            # The traceback references frames and their locals. It must not outlive the hook, hence only a
+            # TracebackException is passed to the worker. It keeps no frames and is formatted by the worker.
+            exc = traceback.TracebackException(
+                exc_type, exc_value, exc_traceback, limit=-tb_limit, lookup_lines=False, capture_locals=False
+            )
+            try:
+                pending.put_nowait((title, f"{exc_type.__name__}: {exc_value}", exc))
+            except queue.Full:
+                logger.warning("Too many pending reports. Dropping '%s'.", title)
+        except Exception as err:
+            _log_failure(err)
+
+    return enqueue
+
+
+def _make_sys_hook(report: Callable[..., None], original: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Build a sys.excepthook that reports an exception and then calls the original hook.
+    Everything is bound when the hook is built, so that calling it requires no further lookups.
+
+    :param report:          callable that is passed the exception type, value and traceback (see _make_enqueue)
+    :param original:        the original sys.excepthook
+    :return:                the new hook
+    """
+
+    def hook(exc_type: Type[BaseException], exc_value: BaseException, exc_traceback: Any) -> Any:
+        report(exc_type, exc_value, exc_traceback)
+        return original(exc_type, exc_value, exc_traceback)
+
+    return hook
+
+
+def _make_threading_hook(report: Callable[..., None], original: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Build a threading.excepthook that reports an exception and then calls the original hook.
+    Everything is bound when the hook is built, so that calling it requires no further lookups.
+
+    :param report:          callable that is passed the exception type, value and traceback (see _make_enqueue)
+    :param original:        the original threading.excepthook
+    :return:                the new hook
+    """
+
+    def hook(args: Any) -> Any:
+        report(args.exc_type, args.exc_value, args.exc_traceback)
+        return original(args)
+
+    return hook
+
+
 def catch_all(f):
     """
     Catch all errors and write them to logging.exception.
+    Kept for backwards compatibility, the Reporter guards its hooks itself.
     """
 
     @functools.wraps(f)
@@ -114,77 +552,217 @@ class Reporter:
     gitlab: Optional[Gitlab] = None
     project_id: Optional[int] = None
     assignee_id: Optional[int] = None
+    cooldown_seconds: float = 60.0
+    tb_limit: int = TB_LIMIT
+    _ready: bool = False
+    _project: Optional[Project] = None
+    _use_graphql: bool = True
+    _iids: Dict[str, Dict[str, Any]] = {}
+    _iids_path: Optional[str] = None
+    _recent: "OrderedDict[str, float]" = OrderedDict()
+    _recent_lock = threading.Lock()
+    _queue: "queue.Queue[Tuple[str, str, traceback.TracebackException]]" = queue.Queue(maxsize=QUEUE_SIZE)
+    _worker_thread: Optional[threading.Thread] = None
 
     @classmethod
-    def _handle_sys_exception(cls, exc_type: Type[BaseException], exc_value: BaseException, exc_traceback: Any) -> None:
+    def _worker(cls) -> None:
         """
-        Handle uncaught exceptions.
+        Send queued reports to Gitlab. Runs forever inside a daemon thread.
 
-        :param exc_type:            Exception type.
-        :param exc_value:           Exception value.
-        :param exc_traceback:       Exception traceback, can be manipulated with the traceback module.
+        :return: None
+        """
+        while True:
+            batch = cls._drain()
+            try:
+                # All reports of a batch share the same timestamp
+                now_iso = datetime.datetime.now().isoformat(timespec="seconds")
+                # Coalesce duplicates: only the newest traceback of each title is reported
+                newest = {title: (summary, exc) for title, summary, exc in batch}
+                for title, (summary, exc) in newest.items():
+                    try:
+                        cls._report(title, summary, exc, now_iso=now_iso)
+                    except Exception as err:
+                        _log_failure(err)
+            finally:
+                for _ in batch:
+                    cls._queue.task_done()
 
-        :return:Calls the original sys.excepthook
+    @classmethod
+    def _drain(cls) -> List[Tuple[str, str, traceback.TracebackException]]:
         """
-        if cls.initialized():
-            cls._create_or_reopen_issue(exc_type, exc_value, exc_traceback)
-        else:
-            logger.info('python-gitlab-reporter not configured. Nothing to do.')
+        Block until a report is queued, then collect further reports for up to BATCH_WAIT seconds.
 
-        return _original_sys_excepthook(exc_type, exc_value, exc_traceback)
+        :return: Up to BATCH_SIZE reports in the order they were queued.
+        """
+        batch = [cls._queue.get()]
+        deadline = time.monotonic() + BATCH_WAIT
+        while len(batch) < BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(cls._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
 
     @classmethod
-    def _handle_threading_exception(cls, args):
+    def _report(cls, title: str, summary: str, exc: traceback.TracebackException,
+                now_iso: Optional[str] = None) -> None:
         """
-        Handle uncaught exceptions raised by `Thread.run()`.
+        Create a new issue on Gitlab or reopen an existing issue with the same title.
 
-        :param exc_type:            Exception type.
-        :param exc_value:           Exception value, can be None.
-        :param exc_traceback:       Exception traceback, can be None.
-        :param thread:              Thread which raised the exception, can be None.
+        :param title:               Title of the issue.
+        :param summary:             Exception summary, e.g. "ValueError: Ooopsie".
+        :param exc:                 The exception to report.
+        :param now_iso:             Timestamp of the error. Defaults to now.
 
-        :return: Calls the original threading.excepthook
+        :return: None
         """
-        if cls.initialized():
-            cls._create_or_reopen_issue(args.exc_type, args.exc_value, args.exc_traceback)
+
+        def describe() -> str:
+            return _render_description(summary, _format_traceback(exc), now_iso=now_iso)
+
+        # The project never changes for a fixed project_id, so it is only fetched once
+        project = cls._project or cls.gitlab.projects.get(cls.project_id)  # type:ignore
+        cls._project = project
+
+        # Was the issue reported before, maybe by a previous run?
+        description = None
+        if title in cls._iids:
+            description = describe()
+            try:
+                issue = project.issues.get(cls._iids[title]["iid"], lazy=True)
+                _reopen_issue(issue, description)
+                cls._remember(title, issue.iid)
+                return
+            except GitlabError:
+                # The issue is gone (e.g. deleted)
+                del cls._iids[title]
+
+        # Does an issue with the same title already exists?
+        issue = cls._find_issue(project, title)
+
+        # The (potentially large) description is only formatted once it is certain to be sent
+        description = description or describe()
+        if issue is not None:
+            # Found existing issue
+            # Reopen it and/or update it's description
+            _reopen_issue(issue, description)
         else:
-            logger.info('python-gitlab-reporter not configured. Nothing to do.')
+            # There is no existing issue -> the error is new
+            issue = _create_issue(project, title, description, assignee_id=cls.assignee_id)
+
+        cls._remember(title, issue.iid)
+
+    @classmethod
+    def _find_issue(cls, project: Project, title: str) -> Optional[ProjectIssue]:
+        """
+        Look up an existing issue by its exact title. GraphQL is preferred, because it transfers far less data.
+        Gitlab instances that do not support the query are searched using the REST API instead.
+
+        :param project:             gitlab.Project instance to search in
+        :param title:               Title of the issue.
 
-        return _original_threading_excepthook(args)
+        :return: The matching issue or None
+        """
+        if cls._use_graphql:
+            try:
+                return _find_issue_gql(cls.gitlab, project, title)  # type:ignore
+            except _GraphQLUnsupported as err:
+                logger.debug("Falling back to the REST API: %s", err)
+                cls._use_graphql = False
+
+        return _find_issue(project, title)
 
     @classmethod
-    @catch_all
-    def _create_or_reopen_issue(cls, exc_type: Type[BaseException], exc_value: BaseException,
-                                exc_traceback: Any) -> None:
+    def _start_worker(cls) -> None:
+        """
+        Start the background worker, unless it is already running.
+
+        :return: None
         """
-        Create a new issue on Gitlab for the given error
+        if cls._worker_thread is not None and cls._worker_thread.is_alive():
+            return
+
+        cls._worker_thread = threading.Thread(target=cls._worker, name="python-gitlab-reporter", daemon=True)
+        cls._worker_thread.start()
+        atexit.unregister(cls.flush)
+        atexit.register(cls.flush)
 
-        :param exc_type:            Exception type.
-        :param exc_value:           Exception value, can be None.
-        :param exc_traceback:       Exception traceback, can be None.
+    @classmethod
+    def _install_hooks(cls) -> None:
+        """
+        Install sys.excepthook and threading.excepthook, bound to the current queue and cooldown state.
 
         :return: None
         """
-        if not cls.initialized():
-            raise ValueError("Reporter not initialized. Call Reporter.init() first.")
+        enqueue = _make_enqueue(cls._queue, cls._recent, cls._recent_lock, cls.cooldown_seconds, cls.tb_limit)
+        sys.excepthook = _make_sys_hook(enqueue, _original_sys_excepthook)
 
-        # Does an issue with the same title already exists?
-        title = _title(exc_type, exc_value, exc_traceback)
-        description = _description(exc_type, exc_value, exc_traceback)
-        project = cls.gitlab.projects.get(cls.project_id)  # type:ignore
-
-        for issue in project.issues.list(as_list=False):
-            if issue.title == title:
-                # Found existing issue
-                # Reopen it and/or update it's description
-                _reopen_issue(issue, description)
-                return
+        if not PY_37:
+            threading.excepthook = _make_threading_hook(enqueue, _original_threading_excepthook)  # type:ignore
+
+    @classmethod
+    def _after_fork_in_child(cls) -> None:
+        """
+        A forked child inherits the hooks and the queue, but not the worker thread.
+        Start over with a fresh queue, lock, connection pool and worker, so that the child reports on its own.
 
-        # There is no existing issue -> the error is new
-        _create_issue(project, title, description, assignee_id=cls.assignee_id)
+        :return: None
+        """
+        cls._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        cls._recent_lock = threading.Lock()
+        cls._worker_thread = None
+        if not cls._ready or cls.gitlab is None:
+            return
+
+        _mount_adapter(cls.gitlab.session)
+        cls._start_worker()
+        cls._install_hooks()
 
     @classmethod
-    def init(cls, host: str, private_token: str, project_id: int, assignee_id: Optional[int] = None) -> None:
+    def flush(cls, timeout: float = FLUSH_TIMEOUT) -> bool:
+        """
+        Wait until all queued reports were sent to Gitlab.
+
+        :param timeout:             Maximum number of seconds to wait.
+
+        :return: True if all reports were sent, False if the timeout expired.
+        """
+        with cls._queue.all_tasks_done:
+            return cls._queue.all_tasks_done.wait_for(lambda: not cls._queue.unfinished_tasks, timeout)
+
+    @classmethod
+    def _remember(cls, title: str, iid: Optional[int] = None) -> None:
+        """
+        Remember that an issue with the given title was just reported.
+        The oldest entries are evicted once more than RECENT_CACHE_SIZE titles are known.
+
+        :param title:               Title of the issue.
+        :param iid:                 iid of the issue. If given, it is persisted as well.
+
+        :return: None
+        """
+        with cls._recent_lock:
+            cls._recent[title] = time.monotonic()
+            cls._recent.move_to_end(title)
+            while len(cls._recent) > RECENT_CACHE_SIZE:
+                cls._recent.popitem(last=False)
+
+        if iid is None:
+            return
+
+        cls._iids[title] = {"iid": iid, "reported_at": time.time()}
+        if cls._iids_path is not None:
+            try:
+                _store_iid(cls._iids_path, title, iid)
+            except OSError as err:
+                logger.warning("Could not persist issue iid: %s", err)
+
+    @classmethod
+    def init(cls, host: str, private_token: str, project_id: int, assignee_id: Optional[int] = None,
+             cooldown_seconds: float = 60.0, cache_dir: Optional[str] = DEFAULT_CACHE_DIR) -> None:
         """
         Initialize the Reporter class. All unhandled exceptions will then be logged to Gitlab.
 
@@ -192,23 +770,57 @@ class Reporter:
         :param private_token:       A private API token with API access for the gitlab instance
         :param project_id:          The ID of the project where the issue should be created
         :param assignee_id:         An optional ID of an Gitlab user that will be assigned to the issue
+        :param cooldown_seconds:    The same error is reported at most once within this period
+        :param cache_dir:           Directory to persist known issues in. Pass None to disable persistence.
 
         :return: None
         """
         cls.gitlab = Gitlab(host, private_token=private_token)
+        _mount_adapter(cls.gitlab.session)
         cls.project_id = project_id
         cls.assignee_id = assignee_id
+        cls.cooldown_seconds = cooldown_seconds
+        cls._project = None
+        cls._use_graphql = True
+        cls._iids_path = _iids_path(cache_dir, cls.gitlab.url, project_id) if cache_dir is not None else None
+        cls._iids = _load_iids(cls._iids_path) if cls._iids_path is not None else {}
+        with cls._recent_lock:
+            cls._recent.clear()
+
+        cls._start_worker()
+        cls._install_hooks()
+        cls._ready = True
 
-        sys.excepthook = Reporter._handle_sys_exception
+    @classmethod
+    def uninstall(cls) -> None:
+        """
+        Restore the original sys.excepthook and threading.excepthook.
+
+        :return: None
+        """
+        sys.excepthook = _original_sys_excepthook
 
         if not PY_37:
-            threading.excepthook = Reporter._handle_threading_exception  # type:ignore
+            threading.excepthook = _original_threading_excepthook  # type:ignore
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """
+        Stop reporting errors to Gitlab and restore the original hooks.
+        Reports that were already queued are still sent.
+
+        :return: None
+        """
+        cls._ready = False
+        cls.uninstall()
 
     @classmethod
     def initialized(cls) -> bool:
         """
         Check whether the Reporter was initialized or not.
         """
-        if cls.gitlab is None or cls.project_id is None:
-            return False
-        return True
+        return cls._ready
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=Reporter._after_fork_in_child)
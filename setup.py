@@ -28,6 +28,8 @@ setuptools.setup(
     keywords=["GitLab", "Exceptions", "Logging"],
     python_requires='>=3.7',
     install_requires=[
-        "python-gitlab"
+        "python-gitlab",
+        "requests",
+        "urllib3"
     ],
 )
@@ -1,12 +1,58 @@
+import queue
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
 from threading import Thread
+from traceback import TracebackException
 from unittest.mock import patch, MagicMock
 
-from reporter.core import _description, _title, _create_issue, _reopen_issue, catch_all, Reporter
+from gitlab import GitlabError, GitlabHttpError, GitlabUpdateError
+from requests.adapters import HTTPAdapter
+
+import reporter.core
+from reporter.core import _description, _title, _create_issue, _reopen_issue, _find_issue, _find_issue_gql, \
+    _GraphQLUnsupported, _make_enqueue, _make_sys_hook, _make_threading_hook, catch_all, \
+    _load_iids, _store_iid, Reporter, \
+    RECENT_CACHE_SIZE, MAX_TRACEBACK_SIZE, MAX_SUMMARY_SIZE, MAX_TITLE_SIZE, IID_CACHE_TTL, MAX_CANDIDATES
 
 
 class TestCase(unittest.TestCase):
 
+    def setUp(self):
+        Reporter._start_worker()
+
+    @staticmethod
+    def make_enqueue(pending):
+        return _make_enqueue(pending, Reporter._recent, Reporter._recent_lock, 60, 50)
+
+    @staticmethod
+    def make_reporter():
+        # A mocked Gitlab that searches issues via REST, returns the mocked project
+        Reporter.gitlab = MagicMock()
+        Reporter.project_id = 56789
+        Reporter._ready = True
+        Reporter._use_graphql = False
+        project = Reporter.gitlab.projects.get.return_value
+        project.issues.list.return_value = iter([])
+        return project
+
+    def tearDown(self):
+        Reporter.flush()
+        Reporter.gitlab = None
+        Reporter.project_id = None
+        Reporter.assignee_id = None
+        Reporter._project = None
+        Reporter._ready = False
+        Reporter._use_graphql = True
+        Reporter._iids = {}
+        Reporter._iids_path = None
+        Reporter._recent.clear()
+        sys.excepthook = sys.__excepthook__
+
     def test_description(self):
         try:
             raise ValueError("Ooopsie")
@@ -21,19 +67,98 @@ class TestCase(unittest.TestCase):
         self.assertEqual(description[6], "ValueError: Ooopsie")
         self.assertEqual(description[-1], "(*This issue was automatically opened by python-gitlab-reporter*)")
 
+    def test_description_timestamp(self):
+        err = ValueError("Ooopsie")
+        description = _description(err.__class__, err, None, now_iso="2021-01-01T12:00:00")
+
+        self.assertIn("The error lastly occurred at: **2021-01-01T12:00:00**", description)
+
+    def test_description_limits_frames(self):
+        def recurse(n):
+            if n == 0:
+                raise ValueError("Deep")
+            recurse(n - 1)
+
+        try:
+            recurse(100)
+        except ValueError as err:
+            description = _description(err.__class__, err, err.__traceback__, limit=2)
+
+        self.assertEqual(description.count('File "'), 2)
+        self.assertIn("ValueError: Deep", description)
+
+    def test_description_is_clipped(self):
+        # A long chain of exceptions with long messages: the outermost ones are dropped
+        err = None
+        for i in range(MAX_TRACEBACK_SIZE // 1000):
+            cause, err = err, ValueError(f"{i:03}" + "x" * 2000)
+            err.__cause__ = cause
+        description = _description(err.__class__, err, None)
+
+        self.assertLess(len(description), MAX_TRACEBACK_SIZE + MAX_SUMMARY_SIZE + 1024)
+        self.assertIn("... (truncated)", description)
+        self.assertNotIn("ValueError: 000x", description)
+        self.assertIn(f"ValueError: {i:03}x", description.split("```")[1])
+        self.assertEqual(
+            description.splitlines()[-1], "(*This issue was automatically opened by python-gitlab-reporter*)"
+        )
+
+    def test_description_keeps_innermost_frames(self):
+        def inner():
+            raise ValueError("x" * (MAX_TRACEBACK_SIZE * 2))
+
+        try:
+            inner()
+        except ValueError as err:
+            description = _description(err.__class__, err, err.__traceback__)
+
+        header = description.splitlines()[0]
+        self.assertLessEqual(len(header), MAX_SUMMARY_SIZE + len("# Uncaught exception ''"))
+        self.assertIn("in inner", description)
+        self.assertIn("ValueError: xxx", description)
+        self.assertLess(len(description), 3 * MAX_SUMMARY_SIZE + 2048)
+
     def test_title(self):
         try:
             raise ValueError("Ooopsie")
         except ValueError as err:
             title = _title(err.__class__, err, err.__traceback__)
-        self.assertEqual(title, "ValueError: Ooopsie")
+        self.assertRegex(title, r"^ValueError: Ooopsie @ test_core\.py:\d+$")
 
         try:
             Thread(target=lambda: 1 / 0).run()
         except ZeroDivisionError as err:
             title = _title(err.__class__, err, err.__traceback__)
 
-        self.assertEqual(title, "ZeroDivisionError: division by zero")
+        self.assertRegex(title, r"^ZeroDivisionError: division by zero @ test_core\.py:\d+$")
+
+        err = ValueError("Ooopsie")
+        self.assertEqual(_title(err.__class__, err, None), "ValueError: Ooopsie")
+
+    def test_title_is_clipped(self):
+        try:
+            raise ValueError("x" * 1000)
+        except ValueError as err:
+            title = _title(err.__class__, err, err.__traceback__)
+
+        self.assertEqual(len(title), MAX_TITLE_SIZE)
+        self.assertRegex(title, r"^ValueError: x+\.\.\. @ test_core\.py:\d+$")
+
+        err = ValueError("x" * 1000)
+        self.assertEqual(len(_title(err.__class__, err, None)), MAX_TITLE_SIZE)
+
+    def test_title_differs_per_location(self):
+        def fail():
+            raise ValueError("Ooopsie")
+
+        titles = set()
+        for raiser in (fail, lambda: int("Ooopsie"), fail):
+            try:
+                raiser()
+            except ValueError as err:
+                titles.add(_title(ValueError, ValueError("Ooopsie"), err.__traceback__))
+
+        self.assertEqual(len(titles), 2)
 
     def test_create_issue_no_assignee(self):
         project = MagicMock()
@@ -73,6 +198,148 @@ class TestCase(unittest.TestCase):
         self.assertEqual(issue.description, "New text")
         issue.save.assert_called_once()
 
+    def test_find_issue(self):
+        project = MagicMock()
+        project.issues.list.return_value = iter([
+            MagicMock(title="ValueError: Ooopsie!!"),
+            MagicMock(title="ValueError: Ooopsie"),
+        ])
+
+        issue = _find_issue(project, "ValueError: Ooopsie")
+
+        self.assertEqual(issue.title, "ValueError: Ooopsie")
+        project.issues.list.assert_called_once_with(
+            query_parameters={
+                "search": "ValueError: Ooopsie", "in": "title", "state": "all", "order_by": "updated_at", "sort": "desc"
+            },
+            per_page=100,
+            iterator=True,
+        )
+
+    def test_find_issue_is_bounded(self):
+        project = MagicMock()
+        candidates = [MagicMock(title="ValueError: Ooopsie!!") for _ in range(MAX_CANDIDATES)]
+        project.issues.list.return_value = iter(candidates + [MagicMock(title="ValueError: Ooopsie")])
+
+        self.assertIsNone(_find_issue(project, "ValueError: Ooopsie"))
+
+    def test_find_issue_no_match(self):
+        project = MagicMock()
+        project.issues.list.return_value = iter([MagicMock(title="ValueError: Ooopsie!!")])
+
+        self.assertIsNone(_find_issue(project, "ValueError: Ooopsie"))
+
+    def test_find_issue_gql(self):
+        gitlab = MagicMock(url="https://gitlab")
+        gitlab.http_post.return_value = {"data": {"project": {"issues": {"nodes": [
+            {"iid": "1", "title": "ValueError: Ooopsie!!"},
+            {"iid": "2", "title": "ValueError: Ooopsie"},
+        ], "pageInfo": {"hasNextPage": False, "endCursor": None}}}}}
+        project = MagicMock(path_with_namespace="group/project")
+
+        issue = _find_issue_gql(gitlab, project, "ValueError: Ooopsie")
+
+        self.assertIs(issue, project.issues.get.return_value)
+        project.issues.get.assert_called_once_with(2, lazy=True)
+        (url,), kwargs = gitlab.http_post.call_args
+        variables = kwargs["post_data"]["variables"]
+        self.assertEqual(url, "https://gitlab/api/graphql")
+        self.assertEqual(variables, {"path": "group/project", "search": "ValueError: Ooopsie", "after": None})
+
+    def test_find_issue_gql_pages(self):
+        def page(titles, end_cursor):
+            nodes = [{"iid": str(i), "title": t} for i, t in enumerate(titles)]
+            page_info = {"hasNextPage": end_cursor is not None, "endCursor": end_cursor}
+            return {"data": {"project": {"issues": {"nodes": nodes, "pageInfo": page_info}}}}
+
+        gitlab = MagicMock(url="https://gitlab")
+        gitlab.http_post.side_effect = [
+            page(["ValueError: Ooopsie!!"] * 100, "cursor"),
+            page(["ValueError: Ooopsie"], None),
+        ]
+        project = MagicMock(path_with_namespace="group/project")
+
+        issue = _find_issue_gql(gitlab, project, "ValueError: Ooopsie")
+
+        self.assertIs(issue, project.issues.get.return_value)
+        self.assertEqual(gitlab.http_post.call_count, 2)
+        self.assertEqual(gitlab.http_post.call_args[1]["post_data"]["variables"]["after"], "cursor")
+
+    def test_find_issue_gql_error(self):
+        gitlab = MagicMock(url="https://gitlab")
+        gitlab.http_post.return_value = {"errors": [{"message": "Field 'issues' doesn't accept argument 'in'"}]}
+
+        with self.assertRaises(_GraphQLUnsupported):
+            _find_issue_gql(gitlab, MagicMock(), "ValueError: Ooopsie")
+
+        gitlab.http_post.return_value = {"errors": [{"message": "unknown", "extensions": {"code": "undefinedField"}}]}
+
+        with self.assertRaises(_GraphQLUnsupported):
+            _find_issue_gql(gitlab, MagicMock(), "ValueError: Ooopsie")
+
+    def test_find_issue_gql_other_errors(self):
+        gitlab = MagicMock(url="https://gitlab")
+
+        # Neither a timeout nor an invisible project mean that the Gitlab version lacks the query
+        for result in ({"errors": [{"message": "Timeout on validation of query"}]},
+                       {"data": {"project": None}}):
+            gitlab.http_post.return_value = result
+            with self.assertRaises(GitlabError) as ctx:
+                _find_issue_gql(gitlab, MagicMock(), "ValueError: Ooopsie")
+            self.assertNotIsInstance(ctx.exception, _GraphQLUnsupported)
+
+    def test_find_issue_keeps_graphql_on_other_errors(self):
+        Reporter.gitlab = MagicMock(url="https://gitlab")
+        Reporter.gitlab.http_post.return_value = {"errors": [{"message": "Internal server error"}]}
+        project = MagicMock()
+
+        with self.assertRaises(GitlabError):
+            Reporter._find_issue(project, "ValueError: Ooopsie")
+
+        project.issues.list.assert_not_called()
+        self.assertTrue(Reporter._use_graphql)
+
+    def test_find_issue_falls_back_to_rest(self):
+        Reporter.gitlab = MagicMock(url="https://gitlab")
+        Reporter.gitlab.http_post.side_effect = GitlabHttpError("Not found", response_code=404)
+        project = MagicMock()
+        project.issues.list.return_value = iter([MagicMock(title="ValueError: Ooopsie")])
+
+        issue = Reporter._find_issue(project, "ValueError: Ooopsie")
+
+        self.assertEqual(issue.title, "ValueError: Ooopsie")
+        self.assertFalse(Reporter._use_graphql)
+
+    def test_find_issue_transient_error(self):
+        Reporter.gitlab = MagicMock(url="https://gitlab")
+        Reporter.gitlab.http_post.side_effect = GitlabHttpError("Bad Gateway", response_code=502)
+        project = MagicMock()
+
+        with self.assertRaises(GitlabHttpError):
+            Reporter._find_issue(project, "ValueError: Ooopsie")
+
+        project.issues.list.assert_not_called()
+        self.assertTrue(Reporter._use_graphql)
+
+    def test_make_sys_hook(self):
+        report, original = MagicMock(), MagicMock()
+        err = ValueError("Oooosie")
+
+        _make_sys_hook(report, original)(err.__class__, err, None)
+
+        report.assert_called_once_with(err.__class__, err, None)
+        original.assert_called_once_with(err.__class__, err, None)
+
+    def test_make_threading_hook(self):
+        report, original = MagicMock(), MagicMock()
+        err = ValueError("Oooosie")
+        args = MagicMock(exc_type=err.__class__, exc_value=err, exc_traceback=None)
+
+        _make_threading_hook(report, original)(args)
+
+        report.assert_called_once_with(err.__class__, err, None)
+        original.assert_called_once_with(args)
+
     def test_catch_all(self):
         @catch_all
         def val_error():
@@ -90,36 +357,277 @@ class TestCase(unittest.TestCase):
         self.assertIsNone(runtime_error())
         self.assertIsNone(overflow_error())
 
+    def test_import_leaves_excepthooks_untouched(self):
+        code = "import sys, reporter.core; assert sys.excepthook is sys.__excepthook__"
+        subprocess.run([sys.executable, "-c", code], check=True)
+
+    @patch("reporter.core._title", side_effect=RuntimeError("Broken"))
+    def test_failures_are_logged(self, _):
+        enqueue = self.make_enqueue(queue.Queue())
+        err = ValueError("Oooosie")
+
+        with self.assertLogs("python-gitlab-reporter", level="ERROR") as logs:
+            self.assertIsNone(enqueue(err.__class__, err, None))
+        self.assertIn("Broken", logs.output[0])
+        self.assertIsNone(logs.records[0].exc_info)
+
+        with self.assertLogs("python-gitlab-reporter", level="DEBUG") as logs:
+            enqueue(err.__class__, err, None)
+        self.assertIsNotNone(logs.records[0].exc_info)
+
+    def test_reporter_uninstall(self):
+        Reporter.init("https://gitlab", "12345", 56789, cache_dir=None)
+        self.assertIsNot(sys.excepthook, reporter.core._original_sys_excepthook)
+
+        Reporter.uninstall()
+
+        self.assertIs(sys.excepthook, reporter.core._original_sys_excepthook)
+        self.assertTrue(Reporter.initialized())
+
     def test_reporter_init(self):
         self.assertFalse(Reporter.initialized())
 
-        Reporter.init("https://gitlab", "12345", 56789, 9999)
+        Reporter.init("https://gitlab", "12345", 56789, 9999, cache_dir=None)
 
         self.assertEqual(Reporter.gitlab.url, "https://gitlab")
         self.assertEqual(Reporter.gitlab.private_token, "12345")
         self.assertEqual(Reporter.project_id, 56789)
         self.assertEqual(Reporter.assignee_id, 9999)
 
+        adapter = Reporter.gitlab.session.get_adapter("https://gitlab")
+        self.assertIsInstance(adapter, HTTPAdapter)
+        self.assertEqual(adapter.max_retries.total, 3)
+        self.assertIn(429, adapter.max_retries.status_forcelist)
+        self.assertFalse(adapter.max_retries.raise_on_status)
+
         self.assertTrue(Reporter.initialized())
+        self.assertIsNot(sys.excepthook, reporter.core._original_sys_excepthook)
+
+        Reporter.shutdown()
+
+        self.assertFalse(Reporter.initialized())
+        self.assertIs(sys.excepthook, reporter.core._original_sys_excepthook)
 
     @patch("reporter.core._original_sys_excepthook")
-    def test_handle_normal_exception_uninitialized(self, orig_excepthook):
-        err = ValueError("Oooosie")
+    def test_installed_hook_calls_original(self, orig_excepthook):
+        Reporter.init("https://gitlab", "12345", 56789, cache_dir=None)
 
-        Reporter._handle_sys_exception(err.__class__, err, None)
+        with patch.object(Reporter, "_report") as report:
+            err = ValueError("Oooosie")
+            sys.excepthook(err.__class__, err, None)
+            Reporter.flush()
 
-        orig_excepthook.assert_called_once()
         orig_excepthook.assert_called_once_with(err.__class__, err, None)
+        report.assert_called_once()
 
-    @patch("gitlab.Gitlab")
-    @patch("reporter.core._original_sys_excepthook")
-    def test_handle_normal_exception_uninitialized(self, orig_excepthook, mock_gitlab):
-        Reporter.gitlab = mock_gitlab
+    def test_project_is_cached(self):
+        project = self.make_reporter()
+
+        for err in (ValueError("Oooosie"), RuntimeError("Ops")):
+            Reporter._report(str(err), str(err), TracebackException(err.__class__, err, None))
+
+        Reporter.gitlab.projects.get.assert_called_once_with(56789)
+        self.assertEqual(project.issues.create.call_count, 2)
+
+    def test_cooldown(self):
+        pending = queue.Queue()
+        enqueue = self.make_enqueue(pending)
 
         err = ValueError("Oooosie")
+        enqueue(err.__class__, err, None)
+        Reporter._remember(pending.get_nowait()[0])
+        enqueue(err.__class__, err, None)
+        self.assertTrue(pending.empty())
 
-        Reporter._handle_sys_exception(err.__class__, err, None)
+        # Once the cooldown expired the error is reported again
+        with patch("reporter.core.time.monotonic", return_value=time.monotonic() + 60):
+            enqueue(err.__class__, err, None)
+        self.assertEqual(pending.qsize(), 1)
 
-        orig_excepthook.assert_called_once()
-        orig_excepthook.assert_called_once_with(err.__class__, err, None)
-        mock_gitlab.projects.get(56789)
+    def test_recent_cache_is_bounded(self):
+        for i in range(RECENT_CACHE_SIZE + 10):
+            Reporter._remember(f"Error {i}")
+
+        self.assertEqual(len(Reporter._recent), RECENT_CACHE_SIZE)
+        self.assertNotIn("Error 0", Reporter._recent)
+        self.assertIn(f"Error {RECENT_CACHE_SIZE + 9}", Reporter._recent)
+
+    def test_full_queue_drops_reports(self):
+        pending = queue.Queue(maxsize=1)
+        pending.put_nowait(("Pending", "Pending", object()))
+        enqueue = self.make_enqueue(pending)
+
+        err = ValueError("Oooosie")
+        with self.assertLogs("python-gitlab-reporter", level="WARNING"):
+            enqueue(err.__class__, err, None)
+        self.assertEqual(pending.qsize(), 1)
+
+    def test_report_is_sent_in_background(self):
+        project = self.make_reporter()
+
+        err = ValueError("Oooosie")
+        self.make_enqueue(Reporter._queue)(err.__class__, err, None)
+
+        self.assertTrue(Reporter.flush())
+        project.issues.create.assert_called_once()
+        self.assertTrue(Reporter._worker_thread.daemon)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires os.fork")
+    def test_forked_child_reports(self):
+        Reporter.init("https://gitlab", "12345", 56789, cache_dir=None)
+        parent_worker = Reporter._worker_thread
+
+        # The child installs its own hooks, keep the original hook from printing the traceback
+        with patch("reporter.core._original_sys_excepthook"):
+            pid = os.fork()
+        if pid == 0:
+            # Child: report the outcome through the exit status, never return into the test runner
+            status = 1
+            try:
+                with patch.object(Reporter, "_report") as report:
+                    err = ValueError("Oooosie from the child")
+                    sys.excepthook(err.__class__, err, None)
+                    flushed = Reporter.flush(timeout=2.0)
+                if flushed and report.call_count == 1 and Reporter._worker_thread is not parent_worker:
+                    status = 0
+            finally:
+                os._exit(status)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+
+    @patch.object(Reporter, "_report")
+    def test_duplicates_are_coalesced(self, report):
+        first, other, second = object(), object(), object()
+        Reporter._queue.put_nowait(("ValueError: Oooosie", "ValueError: Oooosie", first))
+        Reporter._queue.put_nowait(("RuntimeError: Ops", "RuntimeError: Ops", other))
+        Reporter._queue.put_nowait(("ValueError: Oooosie", "ValueError: Oooosie", second))
+        Reporter.flush()
+
+        self.assertEqual(report.call_count, 2)
+        reported = {call[0][0]: call[0][2] for call in report.call_args_list}
+        self.assertIs(reported["ValueError: Oooosie"], second)
+        self.assertIs(reported["RuntimeError: Ops"], other)
+
+        # The whole batch shares one timestamp
+        timestamps = {call[1]["now_iso"] for call in report.call_args_list}
+        self.assertEqual(len(timestamps), 1)
+
+    def test_store_and_load_iids(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache", "56789.json")
+            self.assertEqual(_load_iids(path), {})
+
+            _store_iid(path, "ValueError: Oooosie", 1)
+            _store_iid(path, "RuntimeError: Ops", 2)
+
+            iids = _load_iids(path)
+            self.assertEqual(iids["ValueError: Oooosie"]["iid"], 1)
+            self.assertEqual(iids["RuntimeError: Ops"]["iid"], 2)
+
+            # Expired entries are discarded
+            with patch("reporter.core.time.time", return_value=time.time() + IID_CACHE_TTL):
+                self.assertEqual(_load_iids(path), {})
+
+    def test_load_iids_broken_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "56789.json")
+            with open(path, "w") as fh:
+                fh.write("{not json")
+
+            self.assertEqual(_load_iids(path), {})
+
+    def test_load_iids_invalid_entries(self):
+        now = time.time()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "56789.json")
+
+            with open(path, "w") as fh:
+                json.dump([], fh)
+            self.assertEqual(_load_iids(path), {})
+
+            with open(path, "w") as fh:
+                json.dump({
+                    "valid": {"iid": 1, "reported_at": now},
+                    "no iid": {"reported_at": now},
+                    "str iid": {"iid": "1", "reported_at": now},
+                    "str timestamp": {"iid": 1, "reported_at": "yesterday"},
+                    "no dict": 1,
+                }, fh)
+            self.assertEqual(list(_load_iids(path)), ["valid"])
+
+            # Writing works despite the broken entries
+            _store_iid(path, "other", 2)
+            self.assertEqual(sorted(_load_iids(path)), ["other", "valid"])
+
+    def test_reporter_init_invalid_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            Reporter.init("https://gitlab", "12345", 56789, cache_dir=tmp)
+            with open(Reporter._iids_path, "w") as fh:
+                json.dump([], fh)
+
+            Reporter.init("https://gitlab", "12345", 56789, cache_dir=tmp)
+
+            self.assertEqual(Reporter._iids, {})
+
+    def test_iids_path_depends_on_host(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            Reporter.init("https://gitlab-a", "12345", 56789, cache_dir=tmp)
+            path_a = Reporter._iids_path
+            Reporter.init("https://gitlab-b", "12345", 56789, cache_dir=tmp)
+            path_b = Reporter._iids_path
+
+        self.assertNotEqual(path_a, path_b)
+        self.assertTrue(path_a.endswith("-56789.json"))
+
+    def test_report_persisted_issue(self):
+        project = self.make_reporter()
+        Reporter._iids = {"ValueError: Oooosie": {"iid": 7, "reported_at": time.time()}}
+        project.issues.get.return_value.iid = 7
+
+        exc = TracebackException(ValueError, ValueError("Oooosie"), None)
+        Reporter._report("ValueError: Oooosie", "ValueError: Oooosie", exc)
+
+        project.issues.get.assert_called_once_with(7, lazy=True)
+        project.issues.get.return_value.save.assert_called_once()
+        project.issues.list.assert_not_called()
+        Reporter.gitlab.http_post.assert_not_called()
+
+    def test_report_persisted_issue_deleted(self):
+        project = self.make_reporter()
+        Reporter._iids = {"ValueError: Oooosie": {"iid": 7, "reported_at": time.time()}}
+        project.issues.get.return_value.save.side_effect = GitlabUpdateError("404 Not Found")
+        project.issues.create.return_value.iid = 8
+
+        with tempfile.TemporaryDirectory() as tmp:
+            Reporter._iids_path = os.path.join(tmp, "56789.json")
+            exc = TracebackException(ValueError, ValueError("Oooosie"), None)
+            Reporter._report("ValueError: Oooosie", "ValueError: Oooosie", exc)
+
+            project.issues.create.assert_called_once()
+            with open(Reporter._iids_path) as fh:
+                self.assertEqual(json.load(fh)["ValueError: Oooosie"]["iid"], 8)
+
+    def test_report_formats_description_after_lookup(self):
+        project = self.make_reporter()
+        project.issues.list.side_effect = GitlabError("Service unavailable")
+        exc = TracebackException(ValueError, ValueError("Oooosie"), None)
+
+        with patch("reporter.core._format_traceback") as format_traceback:
+            with self.assertRaises(GitlabError):
+                Reporter._report("ValueError: Oooosie", "ValueError: Oooosie", exc)
+
+        format_traceback.assert_not_called()
+
+    def test_hook_queues_traceback_exception(self):
+        pending = queue.Queue()
+        try:
+            raise ValueError("Oooosie")
+        except ValueError as err:
+            self.make_enqueue(pending)(err.__class__, err, err.__traceback__)
+
+        title, summary, exc = pending.get_nowait()
+
+        self.assertEqual(summary, "ValueError: Oooosie")
+        self.assertIsInstance(exc, TracebackException)
+        self.assertIn("raise ValueError", "".join(exc.format()))